@@ -3,6 +3,7 @@
 import asyncio
 import json
 import logging
+import os
 import re
 from collections.abc import Awaitable
 from subprocess import CompletedProcess
@@ -13,6 +14,9 @@ from subiquitycore.utils import arun_command, run_command
 
 log = logging.getLogger("subiquity.cloudinit")
 
+# Written by cloud-init at the end of its final stage.
+cloud_init_result_path = "/run/cloud-init/result.json"
+
 
 class CloudInitSchemaValidationError(NonReportableException):
     """Exception for cloud config schema validation failure.
@@ -114,12 +118,40 @@ async def get_schema_failure_keys() -> list[str]:
     return no_quotes
 
 
-async def cloud_init_status_wait() -> (bool, Optional[str]):
-    """Wait for cloud-init completion, and return if timeout ocurred and best
+async def _wait_for_result_file(timeout: float) -> None:
+    """Wait for cloud-init to write result.json, using inotify.
+
+    :raises ImportError: if asyncinotify is not available.
+    :raises OSError: if the watch could not be established.
+    :raises asyncio.TimeoutError: if the file did not appear in time.
+    """
+    from asyncinotify import Inotify, Mask
+
+    async def watch():
+        with Inotify() as inotify:
+            inotify.add_watch(
+                os.path.dirname(cloud_init_result_path),
+                Mask.CREATE | Mask.MOVED_TO | Mask.CLOSE_WRITE,
+            )
+            # cloud-init may have finished between our caller checking and
+            # the watch being established.
+            if os.path.exists(cloud_init_result_path):
+                return
+            async for event in inotify:
+                if event.path.name == os.path.basename(cloud_init_result_path):
+                    return
+
+    await asyncio.wait_for(watch(), timeout)
+
+
+async def _cloud_init_status(*, wait: bool) -> (bool, Optional[str]):
+    """Run cloud-init status, and return if timeout ocurred and best
     available status information.
     :return: tuple of (ok, status string or None)
     """
-    cmd = ["cloud-init", "status", "--wait"]
+    cmd = ["cloud-init", "status"]
+    if wait:
+        cmd += ["--wait"]
     if format_json := supports_format_json():
         cmd += ["--format=json"]
     status_coro = arun_command(cmd)
@@ -135,6 +167,35 @@ async def cloud_init_status_wait() -> (bool, Optional[str]):
     return (True, status)
 
 
+async def cloud_init_status_wait() -> (bool, Optional[str]):
+    """Wait for cloud-init completion, and return if timeout ocurred and best
+    available status information.
+    :return: tuple of (ok, status string or None)
+    """
+    if os.path.exists(cloud_init_result_path):
+        return await _cloud_init_status(wait=False)
+    # Disabled cloud-init never writes result.json, so ask for the
+    # current status before committing to a watch on the file.
+    ok, status = await _cloud_init_status(wait=False)
+    if not ok or (status is not None and "disabled" in status):
+        return (ok, status)
+    # Waiting on the kernel event for result.json is cheaper than
+    # "cloud-init status --wait", which forks a child process that
+    # polls internally.
+    try:
+        await _wait_for_result_file(600)
+    except asyncio.TimeoutError:
+        # Checked before OSError: on Python >= 3.11 asyncio.TimeoutError
+        # is the builtin TimeoutError, a subclass of OSError.
+        return (False, "timeout")
+    except (ImportError, OSError):
+        # asyncinotify is not available or the watch could not be set
+        # up (e.g. /run/cloud-init does not exist yet): fall back to
+        # cloud-init's own polling.
+        return await _cloud_init_status(wait=True)
+    return await _cloud_init_status(wait=False)
+
+
 async def validate_cloud_init_schema() -> None:
     """Check for cloud-init schema errors.
     Returns (None) if the cloud-config schmea validated OK according to
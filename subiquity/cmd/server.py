@@ -217,6 +217,15 @@ def main():
         )
         await server.run()
 
+    try:
+        import uvloop
+    except ImportError:
+        # The default selector event loop works fine, uvloop just has
+        # lower per-task and per-socket-event overhead.
+        pass
+    else:
+        uvloop.install()
+
     asyncio.run(run_with_loop())
 
 
@@ -194,6 +194,17 @@ async def controller_for_request(request):
     return getattr(match_info.handler, "controller", None)
 
 
+def controller_for_matched_request(request):
+    """Return the controller the matched handler was bound to.
+
+    Unlike controller_for_request, this reuses the route resolution
+    aiohttp has already performed for the request, so it is synchronous
+    and O(1). It is only valid once routing has happened, i.e. from
+    middlewares and handlers.
+    """
+    return getattr(request.match_info.handler, "controller", None)
+
+
 def bind(router, endpoint, controller, serializer=None, _depth=None):
     if serializer is None:
         serializer = Serializer()
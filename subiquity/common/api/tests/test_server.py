@@ -25,6 +25,7 @@ from subiquity.common.api.server import (
     MissingImplementationError,
     SignatureMisatchError,
     bind,
+    controller_for_matched_request,
     controller_for_request,
 )
 from subiquitycore.context import Context
@@ -232,6 +233,33 @@ class TestBind(unittest.IsolatedAsyncioTestCase):
 
         self.assertIs(impl, seen_controller)
 
+    async def test_controller_for_matched_request(self):
+        seen_controller = None
+
+        @web.middleware
+        async def middleware(request, handler):
+            nonlocal seen_controller
+            seen_controller = controller_for_matched_request(request)
+            return await handler(request)
+
+        @api
+        class API:
+            class meth:
+                def GET() -> str:
+                    ...
+
+        class Impl(ControllerBase):
+            async def GET(self) -> str:
+                return ""
+
+        impl = Impl()
+
+        async with makeTestClient(API.meth, impl, middlewares=[middleware]) as client:
+            resp = await client.get("/meth")
+            self.assertEqual(await resp.json(), "")
+
+        self.assertIs(impl, seen_controller)
+
     async def test_serialize_query_args(self):
         @api
         class API:
@@ -15,8 +15,11 @@
 
 import asyncio
 import copy
+import functools
 import logging
+import mmap
 import os
+import socket
 import sys
 import time
 from typing import Any, List, Optional
@@ -24,7 +27,6 @@ from typing import Any, List, Optional
 import jsonschema
 import yaml
 from aiohttp import web
-from cloudinit.config.cc_set_passwords import rand_user_password
 from jsonschema.exceptions import ValidationError
 from systemd import journal
 
@@ -34,7 +36,7 @@ from subiquity.cloudinit import (
     get_host_combined_cloud_config,
     validate_cloud_init_schema,
 )
-from subiquity.common.api.server import bind, controller_for_request
+from subiquity.common.api.server import bind, controller_for_matched_request
 from subiquity.common.apidef import API
 from subiquity.common.errorreport import ErrorReport, ErrorReporter, ErrorReportKind
 from subiquity.common.serialize import to_json
@@ -68,26 +70,89 @@ from subiquitycore.snapd import AsyncSnapd, SnapdConnection, get_fake_connection
 from subiquitycore.ssh import host_key_fingerprints, user_key_fingerprints
 from subiquitycore.utils import run_command
 
+try:
+    # The libyaml-backed loader and dumper are much faster than the pure
+    # Python implementations, but are only available if the yaml module
+    # was built against libyaml.
+    from yaml import CSafeDumper as YamlDumper
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeDumper as YamlDumper
+    from yaml import SafeLoader as YamlLoader
+
 NOPROBERARG = "NOPROBER"
 
 iso_autoinstall_path = "cdrom/autoinstall.yaml"
 root_autoinstall_path = "autoinstall.yaml"
 cloud_autoinstall_path = "run/subiquity/cloud.autoinstall.yaml"
 
+journal_socket_path = "/run/systemd/journal/socket"
+
+# Components disabled when free-only mode is enabled.
+FREE_ONLY_COMPONENTS = frozenset({"restricted", "multiverse"})
+
+
+def encode_journal_entry(fields: dict) -> bytes:
+    """Encode fields in the journald native protocol wire format."""
+    parts = []
+    for key, value in fields.items():
+        key = key.encode()
+        value = str(value).encode()
+        if b"\n" in value:
+            parts.append(key + b"\n" + len(value).to_bytes(8, "little") + value + b"\n")
+        else:
+            parts.append(key + b"=" + value + b"\n")
+    return b"".join(parts)
+
+
 log = logging.getLogger("subiquity.server.server")
 
 
+@functools.lru_cache(maxsize=16)
+def endpoints_for_names(endpoint_names: frozenset) -> frozenset:
+    """Resolve a set of endpoint names to API endpoints.
+
+    API attributes are defined at import time and never mutated, so the
+    resolution can be cached.
+    """
+    return frozenset(getattr(API, en, None) for en in endpoint_names) - {None}
+
+
+# The key files these fingerprint do not change for the lifetime of the
+# live session, but fingerprinting them shells out to ssh-keygen.
+_cached_host_key_fingerprints = functools.lru_cache(maxsize=1)(host_key_fingerprints)
+_cached_user_key_fingerprints = functools.lru_cache(maxsize=4)(user_key_fingerprints)
+
+
 class MetaController:
     def __init__(self, app):
         self.app = app
         self.context = app.context.child("Meta")
         self.free_only = False
+        # Cached ["*"] expansion, stored alongside the config it was
+        # computed from so that a rewritten config invalidates it.
+        self._interactive_sections_cache = None
+        # Cached ssh_info_GET result, invalidated when the network
+        # configuration or the installer user credentials change.
+        self._ssh_info_cache = None
+        app.hub.subscribe(InstallerChannels.NETWORK_UP, self._invalidate_ssh_info)
+        # Confirming the install deactivates the controllers that do not
+        # apply to the selected variant, which changes interactive().
+        app.hub.subscribe(
+            InstallerChannels.INSTALL_CONFIRMED, self._invalidate_interactive_sections
+        )
+
+    def _invalidate_ssh_info(self):
+        self._ssh_info_cache = None
+
+    def _invalidate_interactive_sections(self):
+        self._interactive_sections_cache = None
 
     async def status_GET(
         self, cur: Optional[ApplicationState] = None
     ) -> ApplicationStatus:
         if cur == self.app.state:
-            await self.app.state_event.wait()
+            await self.app.wait_state_change()
         return ApplicationStatus(
             state=self.app.state,
             confirming_tty=self.app.confirming_tty,
@@ -108,14 +173,15 @@ class MetaController:
         self.app.restart()
 
     async def mark_configured_POST(self, endpoint_names: List[str]) -> None:
-        endpoints = {getattr(API, en, None) for en in endpoint_names}
-        for controller in self.app.controllers.instances:
-            if controller.endpoint in endpoints:
+        for endpoint in endpoints_for_names(frozenset(endpoint_names)):
+            controller = self.app.controllers_by_endpoint.get(endpoint)
+            if controller is not None:
                 await controller.configured()
 
     async def client_variant_POST(self, variant: str) -> None:
         if variant not in self.app.supported_variants:
             raise ValueError(f"unrecognized client variant {variant}")
+        self._interactive_sections_cache = None
         self.app.base_model.set_source_variant(variant)
         self.app.set_source_variant(variant)
 
@@ -123,6 +189,15 @@ class MetaController:
         return self.app.variant
 
     async def ssh_info_GET(self) -> Optional[LiveSessionSSHInfo]:
+        user_key = (
+            self.app.installer_user_name,
+            self.app.installer_user_passwd_kind,
+            self.app.installer_user_passwd,
+        )
+        if self._ssh_info_cache is not None:
+            cached_user_key, info = self._ssh_info_cache
+            if cached_user_key == user_key:
+                return info
         ips: List[str] = []
         if self.app.base_model.network:
             for dev in self.app.base_model.network.get_all_netdevs():
@@ -136,16 +211,16 @@ class MetaController:
             return None
         user_fingerprints = [
             KeyFingerprint(keytype, fingerprint)
-            for keytype, fingerprint in user_key_fingerprints(username)
+            for keytype, fingerprint in _cached_user_key_fingerprints(username)
         ]
         if self.app.installer_user_passwd_kind == PasswordKind.NONE:
             if not user_key_fingerprints:
                 return None
         host_fingerprints = [
             KeyFingerprint(keytype, fingerprint)
-            for keytype, fingerprint in host_key_fingerprints()
+            for keytype, fingerprint in _cached_host_key_fingerprints()
         ]
-        return LiveSessionSSHInfo(
+        info = LiveSessionSSHInfo(
             username=username,
             password_kind=self.app.installer_user_passwd_kind,
             password=self.app.installer_user_passwd,
@@ -153,15 +228,16 @@ class MetaController:
             ips=ips,
             host_key_fingerprints=host_fingerprints,
         )
+        self._ssh_info_cache = (user_key, info)
+        return info
 
     async def free_only_GET(self) -> bool:
         return self.free_only
 
     async def free_only_POST(self, enable: bool) -> None:
         self.free_only = enable
-        to_disable = {"restricted", "multiverse"}
         # enabling free only mode means disabling components
-        self.app.base_model.mirror.disable_components(to_disable, enable)
+        self.app.base_model.mirror.disable_components(FREE_ONLY_COMPONENTS, enable)
 
     async def interactive_sections_GET(self) -> Optional[List[str]]:
         if self.app.autoinstall_config is None:
@@ -169,29 +245,49 @@ class MetaController:
 
         i_sections = self.app.autoinstall_config.get("interactive-sections", None)
         if i_sections == ["*"]:
+            cache = self._interactive_sections_cache
+            if cache is not None and cache[0] is self.app.autoinstall_config:
+                return cache[1]
             # expand the asterisk to the actual controller key names
-            return [
+            expanded = [
                 controller.autoinstall_key
                 for controller in self.app.controllers.instances
                 if controller.interactive()
                 if controller.autoinstall_key is not None
             ]
+            self._interactive_sections_cache = (self.app.autoinstall_config, expanded)
+            return expanded
 
         return i_sections
 
 
 def get_installer_password_from_cloudinit_log():
+    # cloud-init-output.log can be tens of MB, so jump straight to the
+    # match with mmap rather than decoding it line by line.
+    prefix = b"installer:"
     try:
-        fp = open("/var/log/cloud-init-output.log")
+        fp = open("/var/log/cloud-init-output.log", "rb")
     except FileNotFoundError:
         return None
 
     with fp:
-        for line in fp:
-            if line.startswith("installer:"):
-                return line[len("installer:") :].strip()
-
-    return None
+        try:
+            mm = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # cannot mmap an empty file
+            return None
+        with mm:
+            if mm[: len(prefix)] == prefix:
+                start = len(prefix)
+            else:
+                index = mm.find(b"\n" + prefix)
+                if index < 0:
+                    return None
+                start = index + 1 + len(prefix)
+            end = mm.find(b"\n", start)
+            if end < 0:
+                end = mm.size()
+            return mm[start:end].decode().strip()
 
 
 INSTALL_MODEL_NAMES = ModelNames(
@@ -296,7 +392,10 @@ class SubiquityServer(Application):
         self.set_source_variant(self.supported_variants[0])
         self.block_log_dir = block_log_dir
         self.cloud_init_ok = None
-        self.state_event = asyncio.Event()
+        self._state_cond = asyncio.Condition()
+        self._state_version = 0
+        self._pending_state_write = None
+        self._state_write_handle = None
         self.update_state(ApplicationState.STARTING_UP)
         self.interactive = None
         self.confirming_tty = ""
@@ -310,6 +409,22 @@ class SubiquityServer(Application):
         self.echo_syslog_id = "subiquity_echo.{}".format(os.getpid())
         self.event_syslog_id = "subiquity_event.{}".format(os.getpid())
         self.log_syslog_id = "subiquity_log.{}".format(os.getpid())
+        # Events are written to the journal socket directly (and drained
+        # by a background task, so callers do not block on the sendmsg)
+        # rather than paying for a journal.send() call per event. In
+        # dry-run mode, or if the socket is unavailable, journal.send is
+        # used directly instead.
+        self._journal_sock = None
+        self._journal_queue = None
+        if not self.opts.dry_run:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                sock.connect(journal_socket_path)
+            except OSError:
+                sock.close()
+            else:
+                self._journal_sock = sock
+                self._journal_queue = asyncio.Queue()
         self.command_runner = get_command_runner(self)
         self.package_installer = get_package_installer(self)
 
@@ -335,6 +450,13 @@ class SubiquityServer(Application):
         self.note_data_for_apport("SnapUpdated", str(self.updated))
         self.event_listeners: list[EventListener] = []
         self.autoinstall_config = None
+        self._base_validator = None
+        self.controllers_by_endpoint = {}
+        # State last broadcast on SNAPD_NETWORK_CHANGE, so that netplan
+        # churn that does not actually change anything snapd cares about
+        # does not fan out to all the subscribers.
+        self._last_broadcast_proxy = None
+        self._last_broadcast_ips = None
         self.hub.subscribe(InstallerChannels.NETWORK_UP, self._network_change)
         self.hub.subscribe(InstallerChannels.NETWORK_PROXY_SET, self._proxy_set)
         if self.opts.dry_run:
@@ -365,9 +487,6 @@ class SubiquityServer(Application):
             return
 
         install_context: bool = context.get("is-install-context", default=False)
-        msg: str = ""
-        parent_id: str = ""
-        indent: int = context.full_name().count("/") - 2
 
         # We do filtering on which types of events get reported.
         # For interactive installs, we only want to report the event
@@ -398,11 +517,15 @@ class SubiquityServer(Application):
             if controller is None or controller.interactive():
                 return
 
+        # Only now that the event is known to be pushed is any string
+        # work done.
+        indent: int = context.depth - 2
+
         # Create the message out of the name of the reporter and optionally
         # the description
         name: str = context.full_name()
         if description is not None:
-            msg = f"{name}: {description}"
+            msg: str = f"{name}: {description}"
         else:
             msg = name
 
@@ -416,19 +539,48 @@ class SubiquityServer(Application):
         formatted_message: str = f"{indent_prefix}{msg}"
 
         if context.parent is not None:
-            parent_id = str(context.parent.id)
+            parent_id = context.parent._id_str
         else:
             parent_id = ""
 
-        journal.send(
-            formatted_message,
-            PRIORITY=context.level,
-            SYSLOG_IDENTIFIER=self.event_syslog_id,
-            SUBIQUITY_CONTEXT_NAME=context.full_name(),
-            SUBIQUITY_EVENT_TYPE=event_type,
-            SUBIQUITY_CONTEXT_ID=str(context.id),
-            SUBIQUITY_CONTEXT_PARENT_ID=parent_id,
-        )
+        if self._journal_queue is not None:
+            self._journal_queue.put_nowait(
+                {
+                    "MESSAGE": formatted_message,
+                    "PRIORITY": context.level,
+                    "SYSLOG_IDENTIFIER": self.event_syslog_id,
+                    "SUBIQUITY_CONTEXT_NAME": context.full_name(),
+                    "SUBIQUITY_EVENT_TYPE": event_type,
+                    "SUBIQUITY_CONTEXT_ID": context._id_str,
+                    "SUBIQUITY_CONTEXT_PARENT_ID": parent_id,
+                }
+            )
+        else:
+            journal.send(
+                formatted_message,
+                PRIORITY=context.level,
+                SYSLOG_IDENTIFIER=self.event_syslog_id,
+                SUBIQUITY_CONTEXT_NAME=context.full_name(),
+                SUBIQUITY_EVENT_TYPE=event_type,
+                SUBIQUITY_CONTEXT_ID=context._id_str,
+                SUBIQUITY_CONTEXT_PARENT_ID=parent_id,
+            )
+
+    async def _drain_journal_queue(self):
+        while True:
+            fields = await self._journal_queue.get()
+            try:
+                self._journal_sock.send(encode_journal_entry(fields))
+            except OSError:
+                # journal.send copes with payloads too large for the
+                # socket by passing a memfd, so hand the event to it
+                # rather than dropping it.
+                fields = dict(fields)
+                message = fields.pop("MESSAGE")
+                try:
+                    journal.send(message, **fields)
+                except Exception:
+                    log.exception("pushing event to journal failed")
 
     def report_start_event(self, context, description):
         for listener in self.event_listeners:
@@ -459,11 +611,52 @@ class SubiquityServer(Application):
     def state(self):
         return self._state
 
+    def _schedule_state_write(self, content):
+        self._pending_state_write = content
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Before the loop is running, write synchronously.
+            self._flush_state_write()
+            return
+        if self._state_write_handle is None:
+            # Coalesce bursts of transitions into a single write.
+            self._state_write_handle = loop.call_later(0.05, self._flush_state_write)
+
+    def _flush_state_write(self):
+        if self._state_write_handle is not None:
+            self._state_write_handle.cancel()
+            self._state_write_handle = None
+        if self._pending_state_write is None:
+            return
+        content = self._pending_state_write
+        self._pending_state_write = None
+        write_file(self.state_path("server-state"), content)
+
     def update_state(self, state):
         self._state = state
-        write_file(self.state_path("server-state"), state.name)
-        self.state_event.set()
-        self.state_event.clear()
+        self._schedule_state_write(state.name)
+        self._state_version += 1
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # update_state is called from __init__, before the event loop
+            # is running. There cannot be any waiters yet in that case.
+            return
+        run_bg_task(self._notify_state_waiters())
+
+    async def _notify_state_waiters(self):
+        async with self._state_cond:
+            self._state_cond.notify_all()
+
+    async def wait_state_change(self):
+        # As everything runs on one loop, checking the version in a loop
+        # means a wakeup cannot be missed: any update_state between
+        # capturing the version and waiting bumps the version.
+        version = self._state_version
+        async with self._state_cond:
+            while self._state_version == version:
+                await self._state_cond.wait()
 
     def note_file_for_apport(self, key, path):
         self.error_reporter.note_file_for_apport(key, path)
@@ -520,7 +713,7 @@ class SubiquityServer(Application):
     @web.middleware
     async def middleware(self, request, handler):
         override_status = None
-        controller = await controller_for_request(request)
+        controller = controller_for_matched_request(request)
         if isinstance(controller, SubiquityController):
             if request.headers.get("x-make-view-request") == "yes":
                 if not controller.interactive():
@@ -648,10 +841,27 @@ class SubiquityServer(Application):
                 details=details,
             )
 
+    @property
+    def base_validator(self) -> "jsonschema.protocols.Validator":
+        """Return a Validator instance compiled from base_schema.
+
+        Building the validator once and reusing it is much cheaper than
+        jsonschema.validate(), which recompiles the schema (and
+        meta-validates it) on every call.
+        """
+        if (
+            self._base_validator is None
+            or self._base_validator.schema is not self.base_schema
+        ):
+            validator_cls = jsonschema.validators.validator_for(self.base_schema)
+            validator_cls.check_schema(self.base_schema)
+            self._base_validator = validator_cls(self.base_schema)
+        return self._base_validator
+
     def validate_autoinstall(self):
         with self.context.child("core_validation", level="INFO") as ctx:
             try:
-                jsonschema.validate(self.autoinstall_config, self.base_schema)
+                self.base_validator.validate(self.autoinstall_config)
             except ValidationError as original_exception:
                 # SubiquityServer currently only checks for these sections
                 # of autoinstall. Hardcode until we have better validation.
@@ -671,7 +881,10 @@ class SubiquityServer(Application):
     @with_context(name="read_config")
     def _read_config(self, *, cfg_path: str, context: Context) -> dict[str, Any]:
         with open(cfg_path) as fp:
-            config: dict[str, Any] = yaml.safe_load(fp)
+            # Reading the whole file up front and handing the string to the
+            # loader is faster than having the loader read from the file
+            # object in small chunks.
+            config: dict[str, Any] = yaml.load(fp.read(), Loader=YamlLoader)
 
         autoinstall_config: dict[str, Any]
 
@@ -858,9 +1071,10 @@ class SubiquityServer(Application):
         if autoinstall != {}:
             log.debug("autoinstall found in cloud-config")
             target = self.base_relative(cloud_autoinstall_path)
-            from cloudinit import safeyaml
-
-            write_file(target, safeyaml.dumps(autoinstall))
+            write_file(
+                target,
+                yaml.dump(autoinstall, Dumper=YamlDumper, default_flow_style=False),
+            )
         else:
             log.debug("no autoinstall found in cloud-config")
 
@@ -879,7 +1093,7 @@ class SubiquityServer(Application):
             else:
                 await self.load_cloud_config()
 
-    def select_autoinstall(self):
+    async def select_autoinstall(self):
         # precedence
         # 1. command line argument autoinstall
         # 2. kernel command line argument subiquity.autoinstallpath
@@ -906,10 +1120,16 @@ class SubiquityServer(Application):
             self.base_relative(iso_autoinstall_path),
         )
 
-        for loc in locations:
-            if loc is not None and os.path.exists(loc):
-                break
-        else:
+        def first_existing(paths):
+            # Probing these can mean seeking slow media (the cdrom, say),
+            # so this runs in a thread rather than blocking the loop.
+            for path in paths:
+                if path is not None and os.path.exists(path):
+                    return path
+            return None
+
+        loc = await run_in_thread(first_existing, locations)
+        if loc is None:
             return None
 
         rootpath = self.base_relative(root_autoinstall_path)
@@ -917,9 +1137,11 @@ class SubiquityServer(Application):
         return rootpath
 
     def _user_has_password(self, username):
-        with open("/etc/shadow") as fp:
+        # Scanning in binary mode skips the UTF-8 decode of every line.
+        prefix = (username + ":$").encode()
+        with open("/etc/shadow", "rb") as fp:
             for line in fp:
-                if line.startswith(username + ":$"):
+                if line.startswith(prefix):
                     return True
         return False
 
@@ -931,19 +1153,28 @@ class SubiquityServer(Application):
         passfile = self.state_path("installer-user-passwd")
 
         if os.path.exists(passfile):
-            with open(passfile) as fp:
+            with open(passfile, "rb") as fp:
                 contents = fp.read()
             self.installer_user_passwd_kind = PasswordKind.KNOWN
-            self.installer_user_name, self.installer_user_passwd = contents.split(
-                ":", 1
-            )
+            name, _, passwd = contents.partition(b":")
+            self.installer_user_name = name.decode()
+            self.installer_user_passwd = passwd.decode()
             return
 
+        # cloudinit.config transitively pulls in a lot of modules, so only
+        # import it on the paths that actually generate a password.
+        from cloudinit.config.cc_set_passwords import rand_user_password
+
         def use_passwd(passwd):
             self.installer_user_passwd = passwd
             self.installer_user_passwd_kind = PasswordKind.KNOWN
-            with open(passfile, "w") as fp:
-                fp.write(self.installer_user_name + ":" + passwd)
+            # One write() of a pre-built payload, created 0600 as the
+            # file contains a password.
+            fd = os.open(passfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            try:
+                os.write(fd, f"{self.installer_user_name}:{passwd}".encode())
+            finally:
+                os.close(fd)
 
         if self.opts.dry_run:
             self.installer_user_name = os.environ["USER"]
@@ -973,12 +1204,19 @@ class SubiquityServer(Application):
             self.installer_user_passwd_kind = PasswordKind.NONE
 
     async def start(self):
+        if self._journal_queue is not None:
+            run_bg_task(self._drain_journal_queue())
         self.controllers.load_all()
+        self.controllers_by_endpoint = {
+            controller.endpoint: controller
+            for controller in self.controllers.instances
+            if controller.endpoint is not None
+        }
         await self.start_api_server()
         self.update_state(ApplicationState.CLOUD_INIT_WAIT)
         await self.wait_for_cloudinit()
         self.set_installer_password()
-        self.autoinstall = self.select_autoinstall()
+        self.autoinstall = await self.select_autoinstall()
         self.load_autoinstall_config(only_early=True)
         if self.autoinstall_config and self.controllers.Early.cmds:
             stamp_file = self.state_path("early-commands")
@@ -1000,16 +1238,33 @@ class SubiquityServer(Application):
 
     def exit(self):
         self.update_state(ApplicationState.EXITED)
+        # The client looks for the EXITED state on disk if the server is
+        # gone, so it cannot wait for the debounce timer.
+        self._flush_state_write()
         super().exit()
 
     def _network_change(self):
         if not self.snapd:
             return
+        ips = tuple(
+            sorted(
+                str(ip)
+                for dev in self.base_model.network.get_all_netdevs()
+                if dev.info is not None
+                for ip in dev.actual_global_ip_addresses
+            )
+        )
+        if ips == self._last_broadcast_ips:
+            return
+        self._last_broadcast_ips = ips
         self.hub.broadcast(InstallerChannels.SNAPD_NETWORK_CHANGE)
 
     async def _proxy_set(self):
         if not self.snapd:
             return
+        if self.base_model.proxy.proxy == self._last_broadcast_proxy:
+            return
+        self._last_broadcast_proxy = self.base_model.proxy.proxy
         await run_in_thread(
             self.snapd.connection.configure_proxy, self.base_model.proxy
         )
@@ -1025,6 +1280,7 @@ class SubiquityServer(Application):
                 "-m",
                 "subiquity.cmd.server",
             ] + sys.argv[1:]
+        self._flush_state_write()
         os.execvp(cmdline[0], cmdline)
 
     def make_autoinstall(self):
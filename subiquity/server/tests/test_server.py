@@ -13,6 +13,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import copy
 import os
 import shlex
@@ -32,6 +33,7 @@ from subiquity.server.server import (
     MetaController,
     SubiquityServer,
     cloud_autoinstall_path,
+    encode_journal_entry,
     iso_autoinstall_path,
     root_autoinstall_path,
 )
@@ -65,15 +67,15 @@ class TestAutoinstallLoad(SubiTestCase):
             fp.write(contents)
         return path
 
-    def test_autoinstall_disabled(self):
+    async def test_autoinstall_disabled(self):
         self.server.opts.autoinstall = ""
         self.server.kernel_cmdline = {"subiquity.autoinstallpath": "kernel"}
         self.create(root_autoinstall_path, "root")
         self.create(cloud_autoinstall_path, "cloud")
         self.create(iso_autoinstall_path, "iso")
-        self.assertIsNone(self.server.select_autoinstall())
+        self.assertIsNone(await self.server.select_autoinstall())
 
-    def test_arg_wins(self):
+    async def test_arg_wins(self):
         arg = self.create(self.path("arg.autoinstall.yaml"), "arg")
         self.server.opts.autoinstall = arg
         kernel = self.create(self.path("kernel.autoinstall.yaml"), "kernel")
@@ -81,57 +83,57 @@ class TestAutoinstallLoad(SubiTestCase):
         root = self.create(root_autoinstall_path, "root")
         self.create(cloud_autoinstall_path, "cloud")
         self.create(iso_autoinstall_path, "iso")
-        self.assertEqual(root, self.server.select_autoinstall())
+        self.assertEqual(root, await self.server.select_autoinstall())
         self.assert_contents(root, "arg")
 
-    def test_kernel_wins(self):
+    async def test_kernel_wins(self):
         self.server.opts.autoinstall = None
         kernel = self.create(self.path("kernel.autoinstall.yaml"), "kernel")
         self.server.kernel_cmdline = {"subiquity.autoinstallpath": kernel}
         root = self.create(root_autoinstall_path, "root")
         self.create(cloud_autoinstall_path, "cloud")
         self.create(iso_autoinstall_path, "iso")
-        self.assertEqual(root, self.server.select_autoinstall())
+        self.assertEqual(root, await self.server.select_autoinstall())
         self.assert_contents(root, "kernel")
 
-    def test_root_wins(self):
+    async def test_root_wins(self):
         self.server.opts.autoinstall = None
         self.server.kernel_cmdline = {}
         root = self.create(root_autoinstall_path, "root")
         self.create(cloud_autoinstall_path, "cloud")
         self.create(iso_autoinstall_path, "iso")
-        self.assertEqual(root, self.server.select_autoinstall())
+        self.assertEqual(root, await self.server.select_autoinstall())
         self.assert_contents(root, "root")
 
-    def test_cloud_wins(self):
+    async def test_cloud_wins(self):
         self.server.opts.autoinstall = None
         self.server.kernel_cmdline = {}
         root = self.path(root_autoinstall_path)
         self.create(cloud_autoinstall_path, "cloud")
         self.create(iso_autoinstall_path, "iso")
-        self.assertEqual(root, self.server.select_autoinstall())
+        self.assertEqual(root, await self.server.select_autoinstall())
         self.assert_contents(root, "cloud")
 
-    def test_iso_wins(self):
+    async def test_iso_wins(self):
         self.server.opts.autoinstall = None
         self.server.kernel_cmdline = {}
         root = self.path(root_autoinstall_path)
         # No cloud config file
         self.create(iso_autoinstall_path, "iso")
-        self.assertEqual(root, self.server.select_autoinstall())
+        self.assertEqual(root, await self.server.select_autoinstall())
         self.assert_contents(root, "iso")
 
-    def test_nobody_wins(self):
-        self.assertIsNone(self.server.select_autoinstall())
+    async def test_nobody_wins(self):
+        self.assertIsNone(await self.server.select_autoinstall())
 
-    def test_bogus_autoinstall_argument(self):
+    async def test_bogus_autoinstall_argument(self):
         self.server.opts.autoinstall = self.path("nonexistant.yaml")
         with self.assertRaises(Exception):
-            self.server.select_autoinstall()
+            await self.server.select_autoinstall()
 
     # Only care about changes to autoinstall, not validity
     @patch("subiquity.server.server.SubiquityServer.validate_autoinstall")
-    def test_early_commands_changes_autoinstall(self, validate_mock):
+    async def test_early_commands_changes_autoinstall(self, validate_mock):
         self.server.controllers = Mock()
         self.server.controllers.instances = []
         rootpath = self.path(root_autoinstall_path)
@@ -144,7 +146,7 @@ early-commands: ["{cmd}"]
         arg = self.create(self.path("arg.autoinstall.yaml"), contents)
         self.server.opts.autoinstall = arg
 
-        self.server.autoinstall = self.server.select_autoinstall()
+        self.server.autoinstall = await self.server.select_autoinstall()
         self.server.load_autoinstall_config(only_early=True)
         before_early = {"version": 1, "early-commands": [cmd]}
         self.assertEqual(before_early, self.server.autoinstall_config)
@@ -580,6 +582,24 @@ class TestExceptionHandling(SubiTestCase):
         self.assertIsNone(self.server.nonreportable_error)
 
 
+class TestEncodeJournalEntry(SubiTestCase):
+    def test_single_line(self):
+        self.assertEqual(
+            b"MESSAGE=hello\nPRIORITY=INFO\n",
+            encode_journal_entry({"MESSAGE": "hello", "PRIORITY": "INFO"}),
+        )
+
+    def test_multi_line(self):
+        expected = b"MESSAGE\n" + (3).to_bytes(8, "little") + b"a\nb\n"
+        self.assertEqual(expected, encode_journal_entry({"MESSAGE": "a\nb"}))
+
+    def test_empty_value(self):
+        self.assertEqual(
+            b"SUBIQUITY_CONTEXT_PARENT_ID=\n",
+            encode_journal_entry({"SUBIQUITY_CONTEXT_PARENT_ID": ""}),
+        )
+
+
 class TestEventReporting(SubiTestCase):
     async def asyncSetUp(self):
         opts = Mock()
@@ -718,3 +738,52 @@ class TestEventReporting(SubiTestCase):
         (message,) = journal_send_mock.call_args.args
         self.assertIn("message", message)
         self.assertNotIn("description", message)
+
+    async def test_push_via_journal_socket(self):
+        """Test events are encoded and sent over the journal socket"""
+
+        context: Context = Context(
+            self.server, "MockContext", "description", None, "INFO"
+        )
+        self.server.interactive = False
+        self.server._journal_sock = Mock()
+        self.server._journal_queue = asyncio.Queue()
+
+        with patch("subiquity.server.server.journal.send") as journal_send_mock:
+            self.server.report_info_event(context, "message")
+            journal_send_mock.assert_not_called()
+            self.assertEqual(1, self.server._journal_queue.qsize())
+
+            drain_task = asyncio.create_task(self.server._drain_journal_queue())
+            await asyncio.sleep(0.01)
+            drain_task.cancel()
+
+        journal_send_mock.assert_not_called()
+        self.server._journal_sock.send.assert_called_once()
+        (payload,) = self.server._journal_sock.send.call_args.args
+        self.assertIn(b"MESSAGE=", payload)
+        self.assertIn(b"SUBIQUITY_EVENT_TYPE=info\n", payload)
+
+    async def test_drain_falls_back_to_journal_send(self):
+        """Test a failed socket send falls back to journal.send"""
+
+        context: Context = Context(
+            self.server, "MockContext", "description", None, "INFO"
+        )
+        self.server.interactive = False
+        self.server._journal_sock = Mock()
+        self.server._journal_sock.send.side_effect = OSError()
+        self.server._journal_queue = asyncio.Queue()
+
+        with patch("subiquity.server.server.journal.send") as journal_send_mock:
+            self.server.report_info_event(context, "message")
+            drain_task = asyncio.create_task(self.server._drain_journal_queue())
+            await asyncio.sleep(0.01)
+            drain_task.cancel()
+
+        journal_send_mock.assert_called_once()
+        (message,) = journal_send_mock.call_args.args
+        self.assertIn("message", message)
+        self.assertEqual(
+            "info", journal_send_mock.call_args.kwargs["SUBIQUITY_EVENT_TYPE"]
+        )
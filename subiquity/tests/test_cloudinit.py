@@ -14,12 +14,14 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import asyncio
+import os
 from subprocess import CompletedProcess
 from unittest import skipIf
-from unittest.mock import Mock, patch
+from unittest.mock import Mock, call, patch
 
 from subiquity.cloudinit import (
     CloudInitSchemaValidationError,
+    _wait_for_result_file,
     cloud_init_status_wait,
     cloud_init_version,
     get_schema_failure_keys,
@@ -32,6 +34,13 @@ from subiquity.cloudinit import (
 from subiquitycore.tests import SubiTestCase
 from subiquitycore.tests.parameterized import parameterized
 
+try:
+    import asyncinotify  # noqa: F401
+except ImportError:
+    have_asyncinotify = False
+else:
+    have_asyncinotify = True
+
 
 class TestCloudInitVersion(SubiTestCase):
     @parameterized.expand(
@@ -109,6 +118,21 @@ class TestCloudInitVersion(SubiTestCase):
     def test_read_legacy_status_no_newline(self):
         self.assertEqual("done", read_legacy_status("status: done\n"))
 
+
+class TestCloudInitStatusWait(SubiTestCase):
+    """Tests for cloud_init_status_wait.
+
+    cloud_init_result_path is always patched so that the tests do not
+    depend on the state of /run/cloud-init on the host.
+    """
+
+    def result_path(self, *, exists: bool) -> str:
+        path = os.path.join(self.tmp_dir(), "result.json")
+        if exists:
+            with open(path, "w") as fp:
+                fp.write("{}")
+        return path
+
     @patch("subiquity.cloudinit.arun_command", new=Mock())
     @patch("subiquity.cloudinit.asyncio.wait_for")
     async def test_cloud_init_status_wait_timeout(self, m_wait_for):
@@ -116,7 +140,9 @@ class TestCloudInitVersion(SubiTestCase):
         # immediate timeout means nobody ever awaits on arun_command.
         # Then this test fails with an obtuse looking RuntimeError.
         m_wait_for.side_effect = asyncio.TimeoutError()
-        self.assertEqual((False, "timeout"), await cloud_init_status_wait())
+        path = self.result_path(exists=True)
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            self.assertEqual((False, "timeout"), await cloud_init_status_wait())
 
     @patch("subiquity.cloudinit.supports_format_json", new=Mock(return_value=True))
     @patch("subiquity.cloudinit.arun_command", new=Mock())
@@ -125,7 +151,9 @@ class TestCloudInitVersion(SubiTestCase):
         m_wait_for.return_value = CompletedProcess(
             args=[], returncode=0, stdout='{"extended_status": "disabled"}'
         )
-        self.assertEqual((True, "disabled"), await cloud_init_status_wait())
+        path = self.result_path(exists=True)
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            self.assertEqual((True, "disabled"), await cloud_init_status_wait())
 
     @patch("subiquity.cloudinit.supports_format_json", new=Mock(return_value=False))
     @patch("subiquity.cloudinit.arun_command", new=Mock())
@@ -134,7 +162,85 @@ class TestCloudInitVersion(SubiTestCase):
         m_wait_for.return_value = CompletedProcess(
             args=[], returncode=0, stdout="status: done\n"
         )
-        self.assertEqual((True, "done"), await cloud_init_status_wait())
+        path = self.result_path(exists=True)
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            self.assertEqual((True, "done"), await cloud_init_status_wait())
+
+    @patch("subiquity.cloudinit._wait_for_result_file")
+    @patch("subiquity.cloudinit._cloud_init_status")
+    async def test_result_file_exists_no_watch(self, m_status, m_wait_file):
+        m_status.return_value = (True, "done")
+        path = self.result_path(exists=True)
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            self.assertEqual((True, "done"), await cloud_init_status_wait())
+        m_status.assert_called_once_with(wait=False)
+        m_wait_file.assert_not_called()
+
+    @patch("subiquity.cloudinit._wait_for_result_file")
+    @patch("subiquity.cloudinit._cloud_init_status")
+    async def test_disabled_no_watch(self, m_status, m_wait_file):
+        # Disabled cloud-init never writes result.json, so the status
+        # probe has to answer promptly instead of watching for the file.
+        m_status.return_value = (True, "disabled")
+        path = self.result_path(exists=False)
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            self.assertEqual((True, "disabled"), await cloud_init_status_wait())
+        m_status.assert_called_once_with(wait=False)
+        m_wait_file.assert_not_called()
+
+    @patch("subiquity.cloudinit._wait_for_result_file")
+    @patch("subiquity.cloudinit._cloud_init_status")
+    async def test_running_watches_result_file(self, m_status, m_wait_file):
+        m_status.side_effect = [(True, "running"), (True, "done")]
+        path = self.result_path(exists=False)
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            self.assertEqual((True, "done"), await cloud_init_status_wait())
+        m_wait_file.assert_called_once()
+        self.assertEqual([call(wait=False), call(wait=False)], m_status.call_args_list)
+
+    @patch("subiquity.cloudinit._wait_for_result_file")
+    @patch("subiquity.cloudinit._cloud_init_status")
+    async def test_fall_back_to_status_wait(self, m_status, m_wait_file):
+        m_wait_file.side_effect = ImportError()
+        m_status.side_effect = [(True, "running"), (True, "done")]
+        path = self.result_path(exists=False)
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            self.assertEqual((True, "done"), await cloud_init_status_wait())
+        self.assertEqual([call(wait=False), call(wait=True)], m_status.call_args_list)
+
+    @patch("subiquity.cloudinit._wait_for_result_file")
+    @patch("subiquity.cloudinit._cloud_init_status")
+    async def test_watch_timeout(self, m_status, m_wait_file):
+        m_wait_file.side_effect = asyncio.TimeoutError()
+        m_status.return_value = (True, "running")
+        path = self.result_path(exists=False)
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            self.assertEqual((False, "timeout"), await cloud_init_status_wait())
+        m_status.assert_called_once_with(wait=False)
+
+
+class TestWaitForResultFile(SubiTestCase):
+    @skipIf(not have_asyncinotify, "asyncinotify not available")
+    async def test_existing_file_returns_immediately(self):
+        path = self.tmp_path("result.json")
+        with open(path, "w") as fp:
+            fp.write("{}")
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            await _wait_for_result_file(1)
+
+    @skipIf(not have_asyncinotify, "asyncinotify not available")
+    async def test_waits_for_file_creation(self):
+        path = self.tmp_path("result.json")
+
+        async def create():
+            await asyncio.sleep(0.05)
+            with open(path, "w") as fp:
+                fp.write("{}")
+
+        with patch("subiquity.cloudinit.cloud_init_result_path", path):
+            create_task = asyncio.create_task(create())
+            await _wait_for_result_file(5)
+            await create_task
 
 
 class TestCloudInitSchemaValidation(SubiTestCase):
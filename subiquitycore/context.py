@@ -65,6 +65,15 @@ class Context:
             childlevel = level
         self.childlevel = childlevel
         self.data = {}
+        # Contexts are immutable in practice once created, so values
+        # derived from the parent chain are cached: event reporting looks
+        # them up for every single event.
+        self._id_str = str(self.id)
+        self._full_name = None
+        if parent is None:
+            self.depth = 0
+        else:
+            self.depth = parent.depth + 1
 
     @classmethod
     def new(cls, app):
@@ -76,12 +85,12 @@ class Context:
         return type(self)(self.app, name, description, self, level, childlevel)
 
     def full_name(self):
-        c = self
-        names = []
-        while c is not None:
-            names.append(c.name)
-            c = c.parent
-        return "/".join(reversed(names))
+        if self._full_name is None:
+            if self.parent is None:
+                self._full_name = self.name
+            else:
+                self._full_name = self.parent.full_name() + "/" + self.name
+        return self._full_name
 
     def enter(self, description=None):
         if description is None: